@@ -11,6 +11,7 @@ from homeassistant.const import ATTR_ENTITY_ID
 from homeassistant.core import split_entity_id
 import homeassistant.helpers.config_validation as cv
 
+from .assemble import CACHE_DIR, AssembledAudioView, Assembler, AudioCache
 
 
 DOMAIN = 'lms_tts_notify'
@@ -24,6 +25,8 @@ CONF_ALERT_SOUND = 'alert_sound'
 CONF_FORCE_PLAY = 'force_play'
 CONF_DEVICE_GROUP = 'device_group'
 CONF_PAUSE = 'pause'
+CONF_ASSEMBLE = 'assemble'
+CONF_ALERT_SOUND_PATH = 'alert_sound_path'
 
 # ChimeTTS options
 CONF_CHIMETTS_OPTION_CHIME_PATH = 'chimetts_chime_path'
@@ -37,6 +40,8 @@ ATTR_SYNC_GROUP = 'group_members'
 ATTR_VOLUME = 'volume_level'
 ATTR_POSITION = 'media_position'
 
+ATTR_LANGUAGE = 'language'
+
 GEN_ATTRS = [ATTR_VOLUME, ATTR_SYNC_GROUP, ATTR_POSITION]
 
 SERVICE_SCHEMA = vol.Schema(
@@ -49,6 +54,8 @@ SERVICE_SCHEMA = vol.Schema(
         vol.Optional(CONF_FORCE_PLAY): cv.boolean,
         vol.Optional(CONF_DEVICE_GROUP): cv.entity_id,
         vol.Optional(CONF_PAUSE): cv.positive_float,
+        vol.Optional(CONF_ASSEMBLE): cv.boolean,
+        vol.Optional(CONF_ALERT_SOUND_PATH): cv.string,
         vol.Optional(CONF_CHIMETTS_OPTION_CHIME_PATH): cv.string,
         vol.Optional(CONF_CHIMETTS_OPTION_END_CHIME_PATH): cv.string,
         vol.Optional(CONF_CHIMETTS_OPTION_OFFSET): vol.All(vol.Coerce(int), vol.Range(min=-10000, max=10000)),
@@ -63,7 +70,10 @@ async def async_setup(hass, config):
     '''Load configurations'''
 
     _LOGGER.debug('The %s component is ready!', DOMAIN)
-    coordinator = Coordinator(hass, config)
+    cache = AudioCache(hass.config.path(CACHE_DIR))
+    await hass.async_add_executor_job(cache.load)
+    hass.http.register_view(AssembledAudioView(hass, cache))
+    coordinator = Coordinator(hass, config, Assembler(hass, cache))
     hass.bus.async_listen_once(
         EVENT_HOMEASSISTANT_START, coordinator.start_handler
     )
@@ -100,7 +110,7 @@ async def async_setup(hass, config):
 
 class Coordinator(Thread):
     '''Coordinator for save and restore state sync_groups, recieving tts messages and dispatching to media_players queues'''
-    def __init__(self, hass, config):
+    def __init__(self, hass, config, assembler):
         super().__init__()
         self._name = 'Coordinator'
         self._hass = hass
@@ -117,7 +127,7 @@ class Coordinator(Thread):
                 _LOGGER.debug('config %s', myconfig)
                 media_player = myconfig['media_player']
 
-                self.queue_listener[media_player] = QueueListener(hass, myconfig)
+                self.queue_listener[media_player] = QueueListener(hass, myconfig, assembler)
 
                 self._hass.bus.async_listen_once(
                     EVENT_HOMEASSISTANT_START, self.queue_listener[media_player].start_handler
@@ -397,16 +407,19 @@ class Coordinator(Thread):
 class QueueListener(Thread):
     '''Play tts notify events from queue to mediaplayer'''
 
-    def __init__(self, hass, config):
+    def __init__(self, hass, config, assembler):
         '''Create queue.'''
         super().__init__()
         self._hass = hass
+        self._assembler = assembler
         self.state2 = 'idle'
         self._queue = Queue()
         self._repeat = config.get(CONF_REPEAT)
         self._alert_sound = config.get(CONF_ALERT_SOUND)
         self._volume = config.get(CONF_VOLUME)
         self._pause = config.get(CONF_PAUSE)
+        self._assemble = config.get(CONF_ASSEMBLE)
+        self._alert_sound_path = config.get(CONF_ALERT_SOUND_PATH)
         self._media_player = config[CONF_MEDIA_PLAYER]
         self._tts_engine = config.get(ATTR_ENTITY_ID)
         self._config = config
@@ -446,6 +459,10 @@ class QueueListener(Thread):
             self._alert_sound = event.get(
                 CONF_ALERT_SOUND, self._config.get(CONF_ALERT_SOUND)
             )
+            self._assemble = event.get(CONF_ASSEMBLE, self._config.get(CONF_ASSEMBLE))
+            self._alert_sound_path = event.get(
+                CONF_ALERT_SOUND_PATH, self._config.get(CONF_ALERT_SOUND_PATH)
+            )
             self.force_play = event.get(CONF_FORCE_PLAY, False)
 
             self._chimetts_options = {
@@ -536,6 +553,11 @@ class QueueListener(Thread):
                 'volume_level': self._volume,
             }
             self._hass.services.call('media_player', 'volume_set', service_data)
+        if self._assemble and self._message:
+            if self.play_assembled():
+                return
+            if self._alert_sound_path and not self._alert_sound:
+                _LOGGER.warning('Assembly not possible and no alert_sound playlist set, playing message without alert sound')
         for _ in range(self._repeat):
             # Play alert sound
             if self._alert_sound:
@@ -580,3 +602,48 @@ class QueueListener(Thread):
                 self._hass.services.call(self._tts_group, self._tts_service, service_data)
                 time.sleep(self._timeout/3)  # give tts some time to generate and download if not in cache
                 self.wait_on_idle()
+
+    def play_assembled(self):
+        '''Play alert sound and repeated message as one stream, return False to fall back'''
+        if self._alert_sound and not self._alert_sound_path:
+            _LOGGER.debug('Alert sound %s is a LMS playlist, set alert_sound_path to assemble', self._alert_sound)
+            return False
+        engine = self.assemble_engine()
+        if engine is None:
+            _LOGGER.debug('No TTS engine to assemble with for %s.%s', self._tts_group, self._tts_service)
+            return False
+        assembled = self._assembler.url(
+            self._message,
+            engine,
+            self._config.get(ATTR_LANGUAGE),
+            self._alert_sound_path,
+            self._repeat,
+            self._pause,
+        )
+        if assembled is None:
+            _LOGGER.debug('Assembly not possible, playing alert sound and message separately')
+            return False
+        url, duration = assembled
+        service_data = {
+            'entity_id': self._media_player,
+            'media_content_id': url,
+            'media_content_type': 'music',
+        }
+        _LOGGER.debug('Playing assembled message: %s on %s (%.1fs)', self._message, self._media_player, duration)
+        self._hass.services.call('media_player', 'play_media', service_data)
+        self._timeout = duration
+        time.sleep(self._pause)
+        self.wait_on_idle()
+        return True
+
+    def assemble_engine(self):
+        '''TTS engine behind the configured tts_service, None when unknown'''
+        if 'chime_tts' in self._tts_group:
+            # ChimeTTS does its own chime and audio processing, keep using it
+            return None
+        if self._tts_engine:
+            return self._tts_engine
+        # legacy platforms register their service as <platform>_say by default
+        if self._tts_group == 'tts' and self._tts_service.endswith('_say'):
+            return self._tts_service[:-len('_say')]
+        return None
@@ -0,0 +1,237 @@
+'''Assemble alert sound and tts message into a single mp3 served to the LMS player.'''
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import TimeoutError as FutureTimeoutError
+import hashlib
+import logging
+import os
+import re
+import tempfile
+from threading import Lock
+
+from aiohttp import web
+
+from homeassistant.components import tts
+from homeassistant.components.http import HomeAssistantView
+from homeassistant.helpers.network import NoURLAvailableError, get_url
+
+from .mp3 import assemble, mp3_duration
+
+
+_LOGGER = logging.getLogger(__name__)
+
+CACHE_DIR = 'lms_tts_notify'
+CACHE_SIZE = 20
+TTS_TIMEOUT = 30
+URL_BASE = '/api/lms_tts_notify'
+FILENAME_RE = re.compile(r'^[0-9a-f]{40}\.mp3$')
+
+
+class AudioCache:
+    '''LRU cache of assembled mp3 files, keyed by content hash'''
+
+    def __init__(self, path, size=CACHE_SIZE):
+        self._path = path
+        self._size = size
+        self._files = OrderedDict()
+        self._lock = Lock()
+        self._key_locks = {}
+
+    def load(self):
+        '''Create the cache directory and index existing files, oldest first'''
+        os.makedirs(self._path, exist_ok=True)
+        names = [name for name in os.listdir(self._path) if FILENAME_RE.match(name)]
+        names.sort(key=lambda name: os.path.getmtime(self.path(name)))
+        with self._lock:
+            for name in names:
+                self._files[name] = None
+            self._evict()
+
+    def path(self, filename):
+        '''Return full path of a cached file'''
+        return os.path.join(self._path, filename)
+
+    def lock(self, key):
+        '''Return the lock serializing assembly of key across player threads'''
+        with self._lock:
+            return self._key_locks.setdefault(key, Lock())
+
+    def get(self, key):
+        '''Return filename for key and mark it as recently used'''
+        filename = key + '.mp3'
+        with self._lock:
+            if filename not in self._files:
+                return None
+            self._files.move_to_end(filename)
+        # mtime keeps the use order for load() after a restart
+        try:
+            os.utime(self.path(filename))
+        except OSError:
+            self.discard(key)
+            return None
+        return filename
+
+    def release(self, key):
+        '''Drop the lock of a key that was not stored'''
+        with self._lock:
+            self._key_locks.pop(key, None)
+
+    def discard(self, key):
+        '''Forget key, e.g. when its file is gone from disk'''
+        with self._lock:
+            self._files.pop(key + '.mp3', None)
+
+    def put(self, key, data):
+        '''Store data for key and evict the least recently used files'''
+        filename = key + '.mp3'
+        # write next to the target and rename, so the view never serves a partial file
+        fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=self._path)
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                file.write(data)
+            os.replace(tmp_path, self.path(filename))
+        except OSError:
+            os.remove(tmp_path)
+            raise
+        with self._lock:
+            self._files[filename] = None
+            self._files.move_to_end(filename)
+            self._evict()
+        return filename
+
+    def _evict(self):
+        while len(self._files) > self._size:
+            filename, _ = self._files.popitem(last=False)
+            self._key_locks.pop(filename[:-len('.mp3')], None)
+            _LOGGER.debug('Evict assembled audio: %s', filename)
+            try:
+                os.remove(self.path(filename))
+            except OSError:
+                pass
+
+
+class AssembledAudioView(HomeAssistantView):
+    '''Serve assembled audio files to the LMS players'''
+
+    url = URL_BASE + '/{filename}'
+    name = 'api:lms_tts_notify:audio'
+    requires_auth = False
+
+    def __init__(self, hass, cache):
+        self._hass = hass
+        self._cache = cache
+
+    async def get(self, request, filename):
+        '''Return the cached mp3 file'''
+        if not FILENAME_RE.match(filename):
+            return web.Response(status=404)
+        path = self._cache.path(filename)
+        if not await self._hass.async_add_executor_job(os.path.isfile, path):
+            return web.Response(status=404)
+        return web.FileResponse(path, headers={'Content-Type': 'audio/mpeg'})
+
+
+class Assembler:
+    '''Build and cache single stream alert + message audio from a QueueListener thread'''
+
+    def __init__(self, hass, cache):
+        self._hass = hass
+        self._cache = cache
+        self._non_mp3_engines = set()
+
+    def url(self, message, engine, language, chime_path, repeat, pause):
+        '''Return (url, duration) of the assembled audio or None to fall back to separate playback'''
+        # never raise into the QueueListener thread, it would stop the player queue
+        try:
+            return self._url(message, engine, language, chime_path, repeat, pause)
+        except Exception:  # pylint: disable=broad-except
+            _LOGGER.exception('Assembly failed')
+            return None
+
+    def _url(self, message, engine, language, chime_path, repeat, pause):
+        if engine in self._non_mp3_engines:
+            _LOGGER.debug('TTS engine %s does not return mp3, not assembling', engine)
+            return None
+        try:
+            base_url = get_url(self._hass, prefer_external=False)
+        except NoURLAvailableError:
+            _LOGGER.warning('No Home Assistant URL available to serve assembled audio')
+            return None
+
+        chime = b''
+        if chime_path:
+            path = self.allowed_path(chime_path)
+            if path is None:
+                _LOGGER.warning('Alert sound %s is not inside the config directory or an allowed external dir', chime_path)
+                return None
+            try:
+                with open(path, 'rb') as file:
+                    chime = file.read()
+            except OSError as err:
+                _LOGGER.warning('Could not read alert sound %s: %s', chime_path, err)
+                return None
+
+        key = hashlib.sha1(
+            repr((hashlib.sha1(chime).hexdigest(), message, engine, language, repeat, pause)).encode()
+        ).hexdigest()
+        # players sharing a message wait here and then hit the cache
+        with self._cache.lock(key):
+            assembled = self._cached_or_assembled(key, message, engine, language, chime, repeat, pause)
+        if assembled is None:
+            self._cache.release(key)
+            return None
+        filename, duration = assembled
+        return base_url + URL_BASE + '/' + filename, duration
+
+    def _cached_or_assembled(self, key, message, engine, language, chime, repeat, pause):
+        filename = self._cache.get(key)
+        if filename:
+            _LOGGER.debug('Assembled audio from cache: %s', filename)
+            try:
+                with open(self._cache.path(filename), 'rb') as file:
+                    return filename, mp3_duration(file.read())
+            except OSError as err:
+                _LOGGER.debug('Cached audio %s missing, assembling again: %s', filename, err)
+                self._cache.discard(key)
+
+        future = asyncio.run_coroutine_threadsafe(
+            self._async_get_tts_audio(message, engine, language), self._hass.loop
+        )
+        try:
+            extension, audio = future.result(timeout=TTS_TIMEOUT)
+        except FutureTimeoutError:
+            future.cancel()
+            _LOGGER.warning('TTS audio for assembly not ready within %ss', TTS_TIMEOUT)
+            return None
+        except Exception as err:  # pylint: disable=broad-except
+            _LOGGER.warning('Could not get TTS audio for assembly: %s', err)
+            return None
+        if extension != 'mp3':
+            _LOGGER.warning('TTS engine %s returns %s, only mp3 can be assembled', engine, extension)
+            self._non_mp3_engines.add(engine)
+            return None
+        data = assemble(chime, audio, repeat, pause)
+        if data is None:
+            return None
+        try:
+            filename = self._cache.put(key, data)
+        except OSError as err:
+            _LOGGER.warning('Could not store assembled audio: %s', err)
+            return None
+        duration = mp3_duration(data)
+        _LOGGER.debug('Assembled audio: %s (%.1fs)', filename, duration)
+        return filename, duration
+
+    def allowed_path(self, chime_path):
+        '''Return the real path of chime_path if it is inside the config dir or an allowed external dir'''
+        config_dir = os.path.realpath(self._hass.config.config_dir)
+        path = os.path.realpath(self._hass.config.path(chime_path))
+        if os.path.commonpath([config_dir, path]) == config_dir or self._hass.config.is_allowed_path(path):
+            return path
+        return None
+
+    async def _async_get_tts_audio(self, message, engine, language):
+        media_source_id = tts.generate_media_source_id(
+            self._hass, message, engine=engine, language=language
+        )
+        return await tts.async_get_media_source_audio(self._hass, media_source_id)
@@ -0,0 +1,130 @@
+'''Minimal MPEG layer III frame handling to concatenate mp3 streams without an audio engine.'''
+import logging
+
+
+_LOGGER = logging.getLogger(__name__)
+
+# MPEG audio layer III tables, indexed by version bits (0 = 2.5, 2 = 2, 3 = 1)
+BITRATES = {
+    3: [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    2: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    0: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+SAMPLE_RATES = {
+    3: [44100, 48000, 32000],
+    2: [22050, 24000, 16000],
+    0: [11025, 12000, 8000],
+}
+
+
+def frame_info(data, pos):
+    '''Return (length, samples, sample_rate, mono) of the layer III frame at pos or None'''
+    if pos + 4 > len(data) or data[pos] != 0xFF or data[pos + 1] & 0xE0 != 0xE0:
+        return None
+    version = (data[pos + 1] >> 3) & 3
+    layer = (data[pos + 1] >> 1) & 3
+    bitrate_index = data[pos + 2] >> 4
+    rate_index = (data[pos + 2] >> 2) & 3
+    if version == 1 or layer != 1 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    bitrate = BITRATES[version][bitrate_index] * 1000
+    sample_rate = SAMPLE_RATES[version][rate_index]
+    samples = 1152 if version == 3 else 576
+    padding = (data[pos + 2] >> 1) & 1
+    length = samples // 8 * bitrate // sample_rate + padding
+    mono = (data[pos + 3] >> 6) == 3
+    return length, samples, sample_rate, mono
+
+
+def strip_tags(data):
+    '''Remove ID3v2 header and ID3v1 trailer'''
+    if data[:3] == b'ID3' and len(data) >= 10:
+        size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+        footer = 10 if data[5] & 0x10 else 0
+        data = data[10 + size + footer:]
+    if data[-128:-125] == b'TAG':
+        data = data[:-128]
+    return data
+
+
+def parse_mp3(data):
+    '''Return (frames, duration, sample_rate, mono) of mp3 data or None when not usable'''
+    data = strip_tags(data)
+    frames = []
+    duration = 0.0
+    pos = 0
+    end = None
+    fmt = None
+    while pos < len(data):
+        info = frame_info(data, pos)
+        if info is None:
+            # junk before the first frame or corrupt bytes, resync on the next header
+            pos += 1
+            continue
+        length, samples, sample_rate, mono = info
+        frame = data[pos:pos + length]
+        if len(frame) < length:
+            break
+        # a frame is only trusted when it directly follows the previous one,
+        # or the next one starts right after it (or the data ends)
+        if pos != end and pos + length < len(data) and frame_info(data, pos + length) is None:
+            pos += 1
+            continue
+        if fmt is None:
+            fmt = (sample_rate, mono)
+            # drop Xing/Info/VBRI header frame, it describes only this part
+            if b'Xing' in frame[:64] or b'Info' in frame[:64] or frame[36:40] == b'VBRI':
+                pos += length
+                end = pos
+                continue
+        elif fmt != (sample_rate, mono):
+            return None
+        frames.append(frame)
+        duration += samples / sample_rate
+        pos += length
+        end = pos
+    if not frames:
+        return None
+    return frames, duration, fmt[0], fmt[1]
+
+
+def silence(frame, seconds):
+    '''Return silent frames matching the format of frame for the given seconds'''
+    length, samples, sample_rate, _ = frame_info(frame, 0)
+    # unpadded frame without crc, all zero side info decodes as silence
+    header = bytes([frame[0], frame[1] | 1, frame[2] & 0xFD, frame[3]])
+    length -= (frame[2] >> 1) & 1
+    count = int(seconds * sample_rate / samples)
+    return (header + bytes(length - 4)) * count
+
+
+def mp3_duration(data):
+    '''Return duration in seconds of mp3 data'''
+    parsed = parse_mp3(data)
+    return parsed[1] if parsed else 0.0
+
+
+def assemble(chime, message, repeat, pause):
+    '''Concatenate (chime + message) x repeat with pauses, or None when formats do not match'''
+    parsed_message = parse_mp3(message)
+    if parsed_message is None:
+        _LOGGER.warning('TTS audio is not a usable mp3 stream')
+        return None
+    frames, _, sample_rate, mono = parsed_message
+    gap = silence(frames[0], pause)
+    parts = [gap]
+    if chime:
+        parsed_chime = parse_mp3(chime)
+        if parsed_chime is None or parsed_chime[2:] != (sample_rate, mono):
+            _LOGGER.warning(
+                'Alert sound must be an mp3 with the same sample rate and channels as the TTS audio (%s Hz, %s)',
+                sample_rate, 'mono' if mono else 'stereo'
+            )
+            return None
+        chime = b''.join(parsed_chime[0])
+    message = b''.join(frames)
+    for _ in range(repeat):
+        if chime:
+            parts += [chime, gap]
+        parts += [message, gap]
+    return b''.join(parts)
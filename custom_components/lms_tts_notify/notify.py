@@ -22,10 +22,11 @@ from . import (
     CONF_ALERT_SOUND,
     CONF_DEVICE_GROUP,
     CONF_PAUSE,
+    CONF_ASSEMBLE,
+    CONF_ALERT_SOUND_PATH,
+    ATTR_LANGUAGE,
 )
 
-ATTR_LANGUAGE = "language"
-
 _LOGGER = logging.getLogger(__name__)
 
 PLATFORM_SCHEMA = PLATFORM_SCHEMA.extend(
@@ -40,6 +41,8 @@ PLATFORM_SCHEMA = PLATFORM_SCHEMA.extend(
         vol.Optional(CONF_ALERT_SOUND, default=""): cv.string,
         vol.Optional(CONF_VOLUME, default=""): cv.positive_float,
         vol.Optional(CONF_PAUSE, default=0.5): cv.positive_float,
+        vol.Optional(CONF_ASSEMBLE, default=False): cv.boolean,
+        vol.Optional(CONF_ALERT_SOUND_PATH): cv.string,
     }
 )
 
@@ -0,0 +1,57 @@
+'''Tests for the mp3 frame parser used to assemble alert sound and message.'''
+import importlib.util
+from pathlib import Path
+
+# load the module directly, the package __init__ needs Home Assistant
+_PATH = Path(__file__).parent.parent / 'custom_components' / 'lms_tts_notify' / 'mp3.py'
+_SPEC = importlib.util.spec_from_file_location('lms_tts_notify_mp3', _PATH)
+mp3 = importlib.util.module_from_spec(_SPEC)
+_SPEC.loader.exec_module(mp3)
+
+# MPEG-2 layer III, 32 kbit/s, 24000 Hz, mono: 96 byte frames of 576 samples
+HEADER = bytes([0xFF, 0xF3, 0x44, 0xC4])
+FRAME = HEADER + bytes(range(1, 93))
+FRAME_DURATION = 576 / 24000
+
+
+def test_frame_info():
+    assert mp3.frame_info(FRAME, 0) == (96, 576, 24000, True)
+    assert mp3.frame_info(b'\x00' + FRAME, 0) is None
+
+
+def test_parse_skips_id3_tag():
+    data = b'ID3' + bytes([3, 0, 0, 0, 0, 0, 5]) + b'abcde' + FRAME * 3
+    frames, duration, sample_rate, mono = mp3.parse_mp3(data)
+    assert frames == [FRAME] * 3
+    assert duration == 3 * FRAME_DURATION
+    assert (sample_rate, mono) == (24000, True)
+
+
+def test_parse_ignores_false_sync_in_leading_junk():
+    data = b'junk' + HEADER + b'\x01' * 20 + FRAME * 3
+    frames, duration, _, _ = mp3.parse_mp3(data)
+    assert frames == [FRAME] * 3
+    assert duration == 3 * FRAME_DURATION
+
+
+def test_parse_resyncs_after_corrupt_bytes():
+    data = FRAME * 2 + b'\x00\x01\x02' + FRAME * 2
+    frames, _, _, _ = mp3.parse_mp3(data)
+    assert frames == [FRAME] * 4
+
+
+def test_parse_rejects_non_mp3():
+    assert mp3.parse_mp3(b'RIFF' + bytes(200)) is None
+
+
+def test_assemble_repeats_chime_and_message_with_pauses():
+    data = mp3.assemble(FRAME * 2, FRAME * 5, 2, 0.5)
+    gap = int(0.5 * 24000 / 576)
+    frames, _, _, _ = mp3.parse_mp3(data)
+    # leading pause, then (chime, pause, message, pause) per repeat
+    assert len(frames) == gap + 2 * (2 + gap + 5 + gap)
+
+
+def test_assemble_rejects_mismatched_chime():
+    chime = bytes([0xFF, 0xFB, 0x90, 0x64]) + bytes(413)
+    assert mp3.assemble(chime * 3, FRAME * 5, 1, 0.5) is None